@@ -1,21 +1,28 @@
 import openai
 import google.generativeai as genai
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, status
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, status, BackgroundTasks
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Literal
 import os
-import base64
+import pybase64
 import uuid
-import json
+import orjson
 import asyncio
 import io
-from PIL import Image
-from datetime import datetime, timedelta
-from jose import JWTError, jwt
+import time
+import hashlib
+from cachetools import TTLCache
+from aiolimiter import AsyncLimiter
+from PIL import Image, ImageOps, UnidentifiedImageError
+from datetime import datetime, timedelta, timezone
+import jwt
 from passlib.context import CryptContext
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError
 from dotenv import load_dotenv
 from emergentintegrations.llm.chat import LlmChat, UserMessage, ImageContent
 
@@ -23,11 +30,16 @@ from emergentintegrations.llm.chat import LlmChat, UserMessage, ImageContent
 load_dotenv()
 
 # Initialize FastAPI app
-app = FastAPI(title="Currency Recognition API", version="1.0.0")
+app = FastAPI(
+    title="Currency Recognition API",
+    version="1.0.0",
+    default_response_class=ORJSONResponse
+)
 
 # Initialize OpenAI and Gemini clients
-openai.api_key = os.getenv("OPENAI_API_KEY")
+openai_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+gemini_model = genai.GenerativeModel('gemini-2.0-flash-exp')
 
 # CORS configuration
 app.add_middleware(
@@ -40,15 +52,78 @@ app.add_middleware(
 
 # Security
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# argon2 for new hashes; existing bcrypt hashes still verify and are upgraded on login
+pwd_context = CryptContext(schemes=["argon2", "bcrypt"], deprecated="auto")
 
 # JWT Configuration
 SECRET_KEY = os.getenv("JWT_SECRET")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+
+# Validated tokens: sha256(token) -> (user, expires_at)
+token_cache = TTLCache(maxsize=10000, ttl=TOKEN_CACHE_TTL_SECONDS)
+
+# Upload limits
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Vision models tile images at roughly this size anyway
+MAX_IMAGE_DIMENSION = int(os.getenv("MAX_IMAGE_DIMENSION", "1024"))
+# Inline image formats Gemini accepts; anything else (GIF) is re-encoded
+GEMINI_IMAGE_TYPES = {"image/png", "image/jpeg", "image/webp"}
+# Reject images declaring more pixels than this before they are decoded (PIL raises above twice the limit)
+Image.MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(50_000_000)))
+
+# LLM call limits
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "512"))
+
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "10"))
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "10"))
+OPENAI_QPM = int(os.getenv("OPENAI_QPM", "500"))
+GEMINI_QPM = int(os.getenv("GEMINI_QPM", "500"))
+
+# Shared per-provider pools: bound in-flight calls and stay within the provider's requests per minute
+openai_semaphore = asyncio.Semaphore(OPENAI_CONCURRENCY)
+gemini_semaphore = asyncio.Semaphore(GEMINI_CONCURRENCY)
+openai_limiter = AsyncLimiter(OPENAI_QPM, 60)
+gemini_limiter = AsyncLimiter(GEMINI_QPM, 60)
+
+OPENAI_PROVIDER = "OpenAI GPT-4o-mini"
+GEMINI_PROVIDER = "Google Gemini 2.0 Flash"
+
+# Static prompt text, built once and kept as the leading part of every request
+SYSTEM_MESSAGE = "You are a currency recognition expert. Analyze images of banknotes and coins to identify currency type, denomination, and quantity. Focus on UAH (Ukrainian Hryvnia), USD (US Dollar), and EUR (Euro). Return structured JSON responses."
+ANALYSIS_PROMPT = """Analyze this image of currency (banknotes/coins) and return a JSON response with:
+{
+    "currencies_detected": [
+        {
+            "currency_type": "UAH/USD/EUR/etc",
+            "denomination": "value as string",
+            "quantity": number,
+            "confidence": "high/medium/low"
+        }
+    ],
+    "total_value": "calculated total if same currency type",
+    "notes": "any additional observations",
+    "provider": "%s"
+}"""
+OPENAI_PROMPT = ANALYSIS_PROMPT % OPENAI_PROVIDER
+GEMINI_PROMPT = ANALYSIS_PROMPT % GEMINI_PROVIDER
 
 # Database
-client = MongoClient(os.getenv("MONGO_URL"))
+MONGO_POOL = int(os.getenv("MONGO_POOL", "50"))
+client = AsyncIOMotorClient(
+    os.getenv("MONGO_URL"),
+    maxPoolSize=MONGO_POOL,
+    minPoolSize=min(5, MONGO_POOL),
+    retryWrites=True,
+    w="majority",
+    serverSelectionTimeoutMS=3000,
+    # Read datetimes back as UTC-aware so stored timestamps serialize with an offset
+    tz_aware=True
+)
 db = client.currency_recognition
 users_collection = db.users
 analysis_collection = db.analysis
@@ -80,8 +155,9 @@ class AnalysisResult(BaseModel):
     combined_analysis: dict
 
 # Utility functions
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+def verify_and_update_password(plain_password, hashed_password):
+    """Return (verified, new_hash); new_hash is set when the stored hash needs upgrading"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
@@ -89,124 +165,182 @@ def get_password_hash(password):
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = datetime.now(timezone.utc) + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
+        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def get_token_key(token: str):
+    return hashlib.sha256(token.encode()).digest()
+
+def invalidate_token(token: str):
+    """Drop a token from the validation cache (e.g. on logout)"""
+    token_cache.pop(get_token_key(token), None)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    token_key = get_token_key(credentials.credentials)
+    cached = token_cache.get(token_key)
+    if cached is not None:
+        user, expires_at = cached
+        if expires_at > time.time():
+            return user
+        token_cache.pop(token_key, None)
+    
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-    except JWTError:
+    except jwt.PyJWTError:
         raise credentials_exception
     
-    user = users_collection.find_one({"username": username})
+    user = await users_collection.find_one({"username": username}, {"_id": 0, "username": 1})
     if user is None:
         raise credentials_exception
+    
+    # Cache until the token expires, capped by the cache TTL
+    expires_at = min(payload["exp"], time.time() + TOKEN_CACHE_TTL_SECONDS)
+    token_cache[token_key] = (user, expires_at)
     return user
 
+def detect_image_type(header: bytes):
+    """Return the image MIME type from its magic bytes, or None if not a supported image"""
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+async def read_image_upload(file: UploadFile):
+    """Read an uploaded image, rejecting non-images and files over MAX_IMAGE_BYTES early.
+    Returns the image bytes and their MIME type."""
+    too_large = HTTPException(status_code=413, detail=f"Image must be at most {MAX_IMAGE_BYTES} bytes")
+    if file.size is not None and file.size > MAX_IMAGE_BYTES:
+        raise too_large
+    
+    header = await file.read(16)
+    image_type = detect_image_type(header)
+    if image_type is None:
+        raise HTTPException(status_code=400, detail="File must be an image")
+    
+    chunks = [header]
+    total = len(header)
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        total += len(chunk)
+        if total > MAX_IMAGE_BYTES:
+            raise too_large
+        chunks.append(chunk)
+    return b"".join(chunks), image_type
+
+def downscale_image(image_bytes: bytes, image_type: str):
+    """Re-encode images larger than MAX_IMAGE_DIMENSION as a smaller JPEG, and formats
+    Gemini does not accept as PNG. Returns the (possibly unchanged) image bytes and their MIME type."""
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        if max(image.size) <= MAX_IMAGE_DIMENSION:
+            if image_type in GEMINI_IMAGE_TYPES:
+                return image_bytes, image_type
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+            return buffer.getvalue(), "image/png"
+        
+        # Apply EXIF orientation before the tag is lost on re-encode
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.LANCZOS)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=85, optimize=True)
+        return buffer.getvalue(), "image/jpeg"
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        # Valid magic bytes but a corrupt, truncated or oversized body
+        raise HTTPException(status_code=400, detail="File must be an image")
+
 def convert_image_to_base64(image_bytes):
-    return base64.b64encode(image_bytes).decode('utf-8')
+    return pybase64.b64encode(image_bytes).decode('ascii')
 
 # AI Integration functions
-async def analyze_with_openai(image_base64: str):
+async def call_with_retries(make_call, semaphore: asyncio.Semaphore, limiter: AsyncLimiter):
+    """Await an LLM call with a per-attempt timeout, retrying with exponential backoff"""
+    for attempt in range(LLM_MAX_RETRIES):
+        try:
+            async with semaphore, limiter:
+                return await asyncio.wait_for(make_call(), timeout=LLM_TIMEOUT)
+        except asyncio.TimeoutError:
+            if attempt == LLM_MAX_RETRIES - 1:
+                raise
+            await asyncio.sleep(2 ** attempt)
+
+async def analyze_with_openai(image_url: str):
     try:
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        response = client.chat.completions.create(
+        response = await call_with_retries(lambda: openai_client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {
                     "role": "system",
-                    "content": "You are a currency recognition expert. Analyze images of banknotes and coins to identify currency type, denomination, and quantity. Focus on UAH (Ukrainian Hryvnia), USD (US Dollar), and EUR (Euro). Return structured JSON responses."
+                    "content": SYSTEM_MESSAGE
                 },
                 {
                     "role": "user",
                     "content": [
                         {
                             "type": "text",
-                            "text": """Analyze this image of currency (banknotes/coins) and return a JSON response with:
-                            {
-                                "currencies_detected": [
-                                    {
-                                        "currency_type": "UAH/USD/EUR/etc",
-                                        "denomination": "value as string",
-                                        "quantity": number,
-                                        "confidence": "high/medium/low"
-                                    }
-                                ],
-                                "total_value": "calculated total if same currency type",
-                                "notes": "any additional observations",
-                                "provider": "OpenAI GPT-4o-mini"
-                            }"""
+                            "text": OPENAI_PROMPT
                         },
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{image_base64}"
+                                "url": image_url
                             }
                         }
                     ]
                 }
             ],
-            max_tokens=1000
-        )
+            max_tokens=LLM_MAX_OUTPUT_TOKENS
+        ), openai_semaphore, openai_limiter)
         
         response_text = response.choices[0].message.content
         
         # Try to parse JSON, if fails return raw response
         try:
-            return json.loads(response_text)
-        except:
-            return {"raw_response": response_text, "provider": "OpenAI GPT-4o-mini"}
+            return orjson.loads(response_text)
+        except orjson.JSONDecodeError:
+            return {"raw_response": response_text, "provider": OPENAI_PROVIDER}
             
+    except asyncio.TimeoutError:
+        return {"error": "timeout", "provider": OPENAI_PROVIDER}
     except Exception as e:
-        return {"error": str(e), "provider": "OpenAI GPT-4o-mini"}
+        return {"error": str(e), "provider": OPENAI_PROVIDER}
 
-async def analyze_with_gemini(image_base64: str):
+async def analyze_with_gemini(image_blob: dict):
     try:
-        # Convert base64 to PIL Image for Gemini
-        image_data = base64.b64decode(image_base64)
-        image = Image.open(io.BytesIO(image_data))
-        
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        prompt = """Analyze this image of currency (banknotes/coins) and return a JSON response with:
-        {
-            "currencies_detected": [
-                {
-                    "currency_type": "UAH/USD/EUR/etc",
-                    "denomination": "value as string",
-                    "quantity": number,
-                    "confidence": "high/medium/low"
-                }
-            ],
-            "total_value": "calculated total if same currency type",
-            "notes": "any additional observations",
-            "provider": "Google Gemini 2.0 Flash"
-        }"""
-        
-        response = model.generate_content([prompt, image])
+        response = await call_with_retries(lambda: gemini_model.generate_content_async(
+            [GEMINI_PROMPT, image_blob],
+            generation_config={"max_output_tokens": LLM_MAX_OUTPUT_TOKENS}
+        ), gemini_semaphore, gemini_limiter)
         response_text = response.text
         
         # Try to parse JSON, if fails return raw response
         try:
-            return json.loads(response_text)
-        except:
-            return {"raw_response": response_text, "provider": "Google Gemini 2.0 Flash"}
+            return orjson.loads(response_text)
+        except orjson.JSONDecodeError:
+            return {"raw_response": response_text, "provider": GEMINI_PROVIDER}
             
+    except asyncio.TimeoutError:
+        return {"error": "timeout", "provider": GEMINI_PROVIDER}
     except Exception as e:
-        return {"error": str(e), "provider": "Google Gemini 2.0 Flash"}
+        return {"error": str(e), "provider": GEMINI_PROVIDER}
 
 def combine_ai_results(openai_result: dict, gemini_result: dict):
     """Combine and compare results from both AI providers"""
@@ -218,6 +352,13 @@ def combine_ai_results(openai_result: dict, gemini_result: dict):
         "discrepancies": []
     }
     
+    # Nothing to compare while a provider failed or is still pending
+    if "error" in openai_result or "error" in gemini_result:
+        combined["discrepancies"].append("provider_error")
+        return combined
+    if openai_result.get("status") == "pending" or gemini_result.get("status") == "pending":
+        return combined
+    
     # Try to find consensus between the two results
     openai_currencies = openai_result.get('currencies_detected', [])
     gemini_currencies = gemini_result.get('currencies_detected', [])
@@ -231,21 +372,70 @@ def combine_ai_results(openai_result: dict, gemini_result: dict):
     
     return combined
 
+async def find_cached_analysis(image_hash: str):
+    """Return the AI results of a previous successful analysis of the same image, if any"""
+    return await analysis_collection.find_one(
+        {
+            "image_hash": image_hash,
+            "openai_result.error": {"$exists": False},
+            "gemini_result.error": {"$exists": False},
+            # Unparsed replies are one-off failures, not answers worth reusing
+            "openai_result.raw_response": {"$exists": False},
+            "gemini_result.raw_response": {"$exists": False},
+            "openai_result.status": {"$ne": "pending"},
+            "gemini_result.status": {"$ne": "pending"}
+        },
+        {"_id": 0, "openai_result": 1, "gemini_result": 1}
+    )
+
+def task_result(task: asyncio.Task, provider: str):
+    if task.done():
+        return task.result()
+    return {"status": "pending", "provider": provider}
+
+async def complete_pending_analysis(analysis_id: str, openai_task: asyncio.Task, gemini_task: asyncio.Task):
+    """Store the slower provider's result of a fastest-mode analysis once it arrives"""
+    openai_result, gemini_result = await asyncio.gather(openai_task, gemini_task)
+    await analysis_collection.update_one(
+        {"id": analysis_id},
+        {"$set": {
+            "openai_result": openai_result,
+            "gemini_result": gemini_result,
+            "combined_analysis": combine_ai_results(openai_result, gemini_result)
+        }}
+    )
+
+@app.on_event("startup")
+async def init_database():
+    # Fail fast if MongoDB is unreachable
+    await client.admin.command("ping")
+    await users_collection.create_index("username", unique=True)
+    await analysis_collection.create_index("id", unique=True)
+    # Serves the per-user history query (sorted by newest) without an in-memory sort
+    await analysis_collection.create_index([("user_id", 1), ("timestamp", -1)])
+    await analysis_collection.create_index("image_hash")
+
 # API Routes
 @app.post("/api/register", response_model=Token)
 async def register(user: UserCreate):
+    username_taken = HTTPException(status_code=400, detail="Username already registered")
+    
     # Check if user already exists
-    if users_collection.find_one({"username": user.username}):
-        raise HTTPException(status_code=400, detail="Username already registered")
+    if await users_collection.find_one({"username": user.username}, {"_id": 1}):
+        raise username_taken
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await run_in_threadpool(get_password_hash, user.password)
     user_doc = {
         "username": user.username,
         "hashed_password": hashed_password,
-        "created_at": datetime.utcnow()
+        "created_at": datetime.now(timezone.utc)
     }
-    users_collection.insert_one(user_doc)
+    try:
+        await users_collection.insert_one(user_doc)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration of the same username
+        raise username_taken
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -258,8 +448,19 @@ async def register(user: UserCreate):
 @app.post("/api/login", response_model=Token)
 async def login(user: UserCreate):
     # Authenticate user
-    db_user = users_collection.find_one({"username": user.username})
-    if not db_user or not verify_password(user.password, db_user["hashed_password"]):
+    db_user = await users_collection.find_one({"username": user.username})
+    verified = False
+    if db_user:
+        # Hashing is CPU-bound; keep it off the event loop
+        verified, new_hash = await run_in_threadpool(
+            verify_and_update_password, user.password, db_user["hashed_password"]
+        )
+        if verified and new_hash:
+            await users_collection.update_one(
+                {"username": user.username},
+                {"$set": {"hashed_password": new_hash}}
+            )
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -276,48 +477,79 @@ async def login(user: UserCreate):
 
 @app.post("/api/analyze-currency")
 async def analyze_currency(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    mode: Literal["both", "fastest"] = "both",
     current_user: dict = Depends(get_current_user)
 ):
+    """Analyze with both providers; mode=fastest returns once the first one answers"""
+    analysis_id = str(uuid.uuid4())
     try:
-        # Validate file type
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
-        
-        # Read and convert image
-        image_bytes = await file.read()
-        image_base64 = convert_image_to_base64(image_bytes)
-        
-        # Analyze with both AI providers in parallel
-        openai_task = analyze_with_openai(image_base64)
-        gemini_task = analyze_with_gemini(image_base64)
+        # Validate file type by content and read image
+        image_bytes, image_type = await read_image_upload(file)
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
         
-        openai_result, gemini_result = await asyncio.gather(openai_task, gemini_task)
+        # Reuse results for an image that was already analyzed
+        cached = await find_cached_analysis(image_hash)
+        pending = set()
+        if cached:
+            openai_result = cached["openai_result"]
+            gemini_result = cached["gemini_result"]
+        else:
+            image_bytes, image_type = await run_in_threadpool(downscale_image, image_bytes, image_type)
+            
+            # Build each provider's image input once: a data URL for OpenAI, raw bytes for Gemini
+            image_url = f"data:{image_type};base64,{convert_image_to_base64(image_bytes)}"
+            image_blob = {"mime_type": image_type, "data": image_bytes}
+            
+            # Analyze with both AI providers in parallel
+            openai_task = asyncio.create_task(analyze_with_openai(image_url))
+            gemini_task = asyncio.create_task(analyze_with_gemini(image_blob))
+            
+            if mode == "fastest":
+                # Stop at the first usable result; a provider failing instantly should not win
+                pending = {openai_task, gemini_task}
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    if any("error" not in task.result() for task in done):
+                        break
+            else:
+                await asyncio.gather(openai_task, gemini_task)
+            
+            openai_result = task_result(openai_task, OPENAI_PROVIDER)
+            gemini_result = task_result(gemini_task, GEMINI_PROVIDER)
         
         # Combine results
         combined_analysis = combine_ai_results(openai_result, gemini_result)
         
         # Store in database
         analysis_doc = {
-            "id": str(uuid.uuid4()),
+            "id": analysis_id,
             "user_id": current_user["username"],
             "openai_result": openai_result,
             "gemini_result": gemini_result,
             "combined_analysis": combined_analysis,
-            "timestamp": datetime.utcnow(),
-            "filename": file.filename
+            "timestamp": datetime.now(timezone.utc),
+            "filename": file.filename,
+            "image_hash": image_hash
         }
         
-        analysis_collection.insert_one(analysis_doc)
+        await analysis_collection.insert_one(analysis_doc)
+        
+        if pending:
+            # Fill in the slower provider's result after the response is sent
+            background_tasks.add_task(complete_pending_analysis, analysis_doc["id"], openai_task, gemini_task)
         
         return {
-            "analysis_id": analysis_doc["id"],
+            "analysis_id": analysis_id,
             "openai_result": openai_result,
             "gemini_result": gemini_result,
             "combined_analysis": combined_analysis,
             "timestamp": analysis_doc["timestamp"]
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -326,7 +558,7 @@ async def get_analysis(
     analysis_id: str,
     current_user: dict = Depends(get_current_user)
 ):
-    analysis = analysis_collection.find_one({
+    analysis = await analysis_collection.find_one({
         "id": analysis_id,
         "user_id": current_user["username"]
     })
@@ -342,17 +574,18 @@ async def get_analysis(
 async def get_user_analyses(
     current_user: dict = Depends(get_current_user)
 ):
-    analyses = list(analysis_collection.find(
+    analyses = await analysis_collection.find(
         {"user_id": current_user["username"]},
-        {"_id": 0}  # Exclude MongoDB _id field
-    ).sort("timestamp", -1).limit(10))
+        # Summary fields only; full results are served by /api/analysis/{id}
+        {"_id": 0, "id": 1, "timestamp": 1, "filename": 1, "combined_analysis.consensus": 1}
+    ).sort("timestamp", -1).to_list(length=10)
     
     return {"analyses": analyses}
 
 @app.post("/api/webhook/{analysis_id}")
 async def webhook_analysis_result(analysis_id: str):
     """Webhook endpoint for real-time updates (placeholder for future implementation)"""
-    analysis = analysis_collection.find_one({"id": analysis_id})
+    analysis = await analysis_collection.find_one({"id": analysis_id})
     if not analysis:
         raise HTTPException(status_code=404, detail="Analysis not found")
     